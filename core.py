@@ -1,16 +1,17 @@
 """Core Agent Execution Loop - Reads state from Redis, executes turns, updates state"""
 
 import boto3, json, time, sys, os, traceback, random
-import redis
+import orjson
 import os
 from dotenv import load_dotenv
 from botocore.exceptions import ClientError as BotocoreClientError
 from pathlib import Path
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
 from tools import TOOLS, TOOL_SCHEMAS
 from decimal import Decimal
-from utils import call_llm_api, queue_message_for_task, build_llm_input, generate_task_id, resolve_model, build_completion_message
-from utils import cleanup_task_statuses, cleanup_conversation_history, check_task_activity, proactive_delay, launch_task_agent
+from utils import call_llm_api, queue_message_for_task, queue_messages_for_task_batch, build_llm_input, generate_task_id, resolve_model, build_completion_message
+from utils import cleanup_task_statuses, cleanup_conversation_history, check_task_activity, proactive_delay, launch_task_agent, get_queue_length, get_redis
 from prompts import build_dynamic_system_prompt, build_static_system_prompt
 
 
@@ -23,68 +24,117 @@ class DecimalEncoder(json.JSONEncoder):
 
 load_dotenv()
 
+# Shared clients, created once per process; Redis comes from utils.get_redis
+_BEDROCK = boto3.client('bedrock-runtime')
+
 # Throttling state
 last_req_time = None
 throttle_multiplier = 1.0
 
 msg1 = "[SYSTEM] This is a single-iteration task. You may either respond via text to your parent task or perform one or more simultaneous tool uses, but you will not be able to respond or do further work after tool use "
 msg2 = "[SYSTEM] This is a two-iteration task. You should use this initial iteration to perform you assigned task in one or more simultaneous tool calls, then use your second action to report your results. "
-msg3 = "[SYSTEM] Warning: Iteration {iteration + 1} of {max_iterations}. Finish up your work and perform any final safety and/or hygiene operations and prepare to use your final iteration to report your results if successful, or to thoroughly document failures, any partial successes, and recommended next steps for the parent task."
+msg3 = "[SYSTEM] Warning: Iteration {iteration} of {max_iterations}. Finish up your work and perform any final safety and/or hygiene operations and prepare to use your final iteration to report your results if successful, or to thoroughly document failures, any partial successes, and recommended next steps for the parent task."
 msg4 = "[SYSTEM] Final iteration. Use this final operation to give the parent task your detailed final report rather than using tools."
 
+# Messages that depend only on (max_iterations, iteration)
+_FIXED_SYSTEM_MESSAGES = {(1, 0): msg1, (2, 0): msg2}
+
 def get_system_message(iteration, max_iterations):
-    if max_iterations == 1:
-        system_message = msg1
-    elif max_iterations == 2 and iteration == 0:
-        system_message = msg2
-    elif max_iterations > 2 and max_iterations - iteration == 2:
-        system_message = msg3
-    elif iteration == max_iterations - 1:
-        system_message = msg4
-    else:
-        system_message = None
-    return system_message
+    system_message = _FIXED_SYSTEM_MESSAGES.get((max_iterations, iteration))
+    if system_message is not None:
+        return system_message
+    if max_iterations > 2 and max_iterations - iteration == 2:
+        return msg3.format(iteration=iteration + 1, max_iterations=max_iterations)
+    if iteration == max_iterations - 1:
+        return msg4
+    return None
+
+# Minimum seconds between task status sweeps by the root task
+CLEANUP_INTERVAL = 30
+
+# Tools that must run one at a time, in the order the model requested them
+SERIAL_TOOLS = {'spawn_task'}
+MAX_TOOL_WORKERS = 8
+
+def run_tool(tool_use, task_id):
+    """Run a single tool and wrap its output as a toolResult block"""
+    tool_name = tool_use['name']
+    tool_input = tool_use['input']
+    tool_use_id = tool_use['toolUseId']
+    
+    print(f"[CORE] Executing tool: {tool_name}")
+    
+    try:
+        result = TOOLS[tool_name](tool_input, task_id)
+        
+        # Normalize once (e.g. Decimal -> float) and store as a native JSON block
+        tool_result = {
+            "toolResult": {
+                "toolUseId": tool_use_id,
+                "content": [{"json": json.loads(json.dumps(result, cls=DecimalEncoder))}]
+            }
+        }
+    except Exception as e:
+        error_msg = f"Tool execution failed: {type(e).__name__}: {str(e)}\n{traceback.format_exc()}"
+        print(f"[CORE] Tool error: {error_msg}")
+        tool_result = {
+            "toolResult": {
+                "toolUseId": tool_use_id,
+                "content": [{"json": {"error": error_msg}}],
+                "status": "error"
+            }
+        }
+    return tool_result
+
+def run_tool_group(tool_uses, task_id):
+    """Run a group of tools in order, returning their toolResult blocks"""
+    return [run_tool(tool_use, task_id) for tool_use in tool_uses]
 
 def execute_tools(output, task_id):
-    """Execute tools from assistant response and queue results"""
+    """Execute tools from assistant response concurrently and queue results"""
+    tool_uses = [block['toolUse'] for block in output['message']['content'] if 'toolUse' in block]
+    if not tool_uses:
+        return
     
-    for content_block in output['message']['content']:
-        if 'toolUse' in content_block:
-            tool_use = content_block['toolUse']
-            tool_name = tool_use['name']
-            tool_input = tool_use['input']
-            tool_use_id = tool_use['toolUseId']
-            
-            print(f"[CORE] Executing tool: {tool_name}")
-            
-            try:
-                result = TOOLS[tool_name](tool_input, task_id)
-                
-                tool_result = {
-                    "toolResult": {
-                        "toolUseId": tool_use_id,
-                        "content": [{"text": json.dumps(result, cls=DecimalEncoder)}]
-                    }
-                }
-            except Exception as e:
-                error_msg = f"Tool execution failed: {type(e).__name__}: {str(e)}\n{traceback.format_exc()}"
-                print(f"[CORE] Tool error: {error_msg}")
-                tool_result = {
-                    "toolResult": {
-                        "toolUseId": tool_use_id,
-                        "content": [{"text": json.dumps({"error": error_msg})}],
-                        "status": "error"
-                    }
-                }
-            
-            print(f"[CORE] Queueing tool result {tool_use_id} for {task_id}")
-            queue_message_for_task(task_id, 'tool_result', tool_result, sender_id=task_id, tool_use_id=tool_use_id)
+    # Independent tools each get their own worker; order-sensitive ones share one
+    groups = [[tool_use] for tool_use in tool_uses if tool_use['name'] not in SERIAL_TOOLS]
+    serial_tool_uses = [tool_use for tool_use in tool_uses if tool_use['name'] in SERIAL_TOOLS]
+    if serial_tool_uses:
+        groups.append(serial_tool_uses)
+    
+    with ThreadPoolExecutor(max_workers=min(MAX_TOOL_WORKERS, len(groups))) as executor:
+        futures = [executor.submit(run_tool_group, group, task_id) for group in groups]
+        results_by_id = {
+            tool_result['toolResult']['toolUseId']: tool_result
+            for future in futures
+            for tool_result in future.result()
+        }
+    
+    # Queue results in the order the model requested the tools, not the order they finished
+    items = [
+        ('tool_result', results_by_id[tool_use['toolUseId']], tool_use['toolUseId'])
+        for tool_use in tool_uses
+    ]
+    
+    print(f"[CORE] Queueing {len(items)} tool results for {task_id}")
+    queue_messages_for_task_batch(task_id, items, sender_id=task_id)
 
-def dequeue_messages(task_id):
-    """Send a message to a task by appending to conversation history"""
-    r = redis.Redis(decode_responses=True)
+def dequeue_messages(task_id, r, conversation):
+    """Move queued messages into the current turn of the conversation history
+    
+    Returns the conversation with the dequeued messages appended, so callers
+    don't need to fetch it again.
+    """
+    queue_key = f'task_queue:{task_id}'
+
+    # Drain the queue atomically (MULTI/EXEC) so messages queued between the
+    # read and the delete can't be lost
+    pipe = r.pipeline(transaction=True)
+    pipe.json().get(queue_key)
+    pipe.delete(queue_key)
+    pipe.set(f'task_queue_len:{task_id}', 0)
+    queue_messages, _, _ = pipe.execute()
 
-    conversation = r.json().get(f'task:{task_id}')
     if conversation and isinstance(conversation, list) and len(conversation) > 0:
         current_turn_index = len(conversation) - 1
         current_turn = conversation[-1]
@@ -94,7 +144,6 @@ def dequeue_messages(task_id):
     
     tool_results = []
     text_messages = []
-    queue_messages = r.json().get(f'task_queue:{task_id}')
     if queue_messages:
         for msg in queue_messages:
             sample = str(msg.get('content'))[:100] + '...' if len(str(msg.get('content'))) > 100 else ""
@@ -108,69 +157,84 @@ def dequeue_messages(task_id):
                     text_messages.append(content)
             elif isinstance(msg, str):
                 text_messages.append(msg)
-        r.delete(f'task_queue:{task_id}')
-    conv_key = f"task:{task_id}"
-    conversation = r.json().get(conv_key)
+
+    # Build all new user messages first so they can be appended in one call
+    message_number = len(current_turn['messages'])
+    user_messages = []
     
     # Add tool results first as single user message (if any)
     if tool_results:
-        message_number = len(current_turn['messages'])
-        user_message = {
+        user_messages.append({
             "role": "user",
             "content": tool_results,
             "message_number": message_number,
             "timestamp": time.time()
-        }
-        r.json().arrappend(f'task:{task_id}', f'$[{current_turn_index}].messages', user_message)
+        })
+        message_number += 1
     
     # Add text messages as separate user messages
     for message in text_messages:
-        message_number = len(current_turn['messages'])
-        user_message = {
+        user_messages.append({
             "role": "user",
             "content": [{"text": message}],
             "message_number": message_number,
             "timestamp": time.time()
-        }
-        r.json().arrappend(f'task:{task_id}', f'$[{current_turn_index}].messages', user_message)
+        })
+        message_number += 1
+
+    pipe = r.pipeline(transaction=False)
+    if user_messages:
+        pipe.json().arrappend(f'task:{task_id}', f'$[{current_turn_index}].messages', *user_messages)
+        current_turn['messages'].extend(user_messages)
+        # Carry the new messages so viewers can apply them without refetching the conversation
+        notification = {"type": "append", "turn_number": current_turn_index, "messages": user_messages}
+    else:
+        notification = {"type": "new_message"}
     
     # Notify task via pub/sub
-    r.publish(f"task_messages:{task_id}", json.dumps({"type": "new_message"}))
+    pipe.publish(f"task_messages:{task_id}", orjson.dumps(notification))
+    pipe.execute()
 
-def execute_iteration(task_id, r, bedrock, system_message=None):
-    """Execute one iteration of the agent loop"""
+    return conversation
+
+def execute_iteration(task_id, r, bedrock, task_data, conversation, system_message=None):
+    """Execute one iteration of the agent loop
+    
+    `task_data` and `conversation` are this process's copies of task_data:{task_id}
+    and task:{task_id}. Writes made here are applied to both the copies and Redis,
+    so neither is re-fetched between iterations.
+    """
     global last_req_time, throttle_multiplier
-    task_data = r.json().get(f'task_data:{task_id}')
+    task_key = f'task:{task_id}'
+    task_data_key = f'task_data:{task_id}'
+    api_call_key = f'task_api_call:{task_id}'
 
     print(f"[CORE] Dequeueing messages for {task_id}")
-    dequeue_messages(task_id)
-
-    conversation = r.json().get(f'task:{task_id}')
-    conversation = cleanup_conversation_history(conversation)
+    dequeue_messages(task_id, r, conversation)
+    cleaned = cleanup_conversation_history(conversation)
     
-    current_turn_index = len(conversation) - 1
-    current_turn = conversation[-1]
-    message_number = len(current_turn['messages'])
+    current_turn_index = len(cleaned) - 1
+    turn_path = f'$[{current_turn_index}].messages'
+    # Number by the stored turn, which the assistant message is appended to and viewers count against;
+    # cleanup may insert or drop messages, so the cleaned turn's length can differ
+    message_number = len(conversation[current_turn_index]['messages'])
     print(f"[CORE] Turn {current_turn_index} message {message_number} for {task_id}")
     
-    messages = []
-    for turn in conversation:
-        for msg in turn['messages']:
-            messages.append({'role': msg['role'], 'content': msg['content']})
+    # Bedrock rejects extra keys (message_number, timestamp), so project to role/content
+    messages = [{'role': msg['role'], 'content': msg['content']} for turn in cleaned for msg in turn['messages']]
 
-    r.delete(f'task_queue:{task_id}')
-    system_message = None
-    
-    # Build system prompt
+    # Build system prompt, with any iteration notice in the per-call part
     static_prompt = task_data['static_system_prompt']
-    dynamic_prompt = build_dynamic_system_prompt(task_data, current_turn_index)
+    dynamic_prompt = build_dynamic_system_prompt(task_data, current_turn_index, r)
+    if system_message:
+        dynamic_prompt += f"\n{system_message}\n"
     full_system_prompt = static_prompt + dynamic_prompt
     
     model_arn = task_data['model_name']
     
     input_params = build_llm_input(model_arn, messages, full_system_prompt, TOOL_SCHEMAS)
 
-    r.set(f'task_api_call:{task_id}', json.dumps({
+    r.set(api_call_key, json.dumps({
         'started_at': time.time(),
         'turn': current_turn_index,
         'message_count': message_number
@@ -181,10 +245,9 @@ def execute_iteration(task_id, r, bedrock, system_message=None):
         bedrock, input_params, task_id, r, last_req_time, throttle_multiplier
     )
 
-    r.delete(f'task_api_call:{task_id}')
-
     # Check if task was interrupted (call_llm_api returns False)
     if api_result == False:
+        r.delete(api_call_key)
         print(f"[CORE] Task {task_id} was interrupted, ending turn")
         return True  # Turn ending
     
@@ -195,7 +258,6 @@ def execute_iteration(task_id, r, bedrock, system_message=None):
     stop_reason = response['stopReason']
     usage = response['usage']
         
-    r.json().set(f'task_data:{task_id}', '$.last_usage', usage)
     print(f"[CORE] Stop reason: {stop_reason}")
     print(f"[CORE] Tokens - Input: {usage['inputTokens']}, Output: {usage['outputTokens']}")
     
@@ -207,34 +269,40 @@ def execute_iteration(task_id, r, bedrock, system_message=None):
         'timestamp': time.time()
     }
     
-    r.json().arrappend(f'task:{task_id}', f'$[{current_turn_index}].messages', assistant_message)
-
-    if stop_reason == 'tool_use':
-        print(f"[CORE] Executing tools for {task_id}")
-        execute_tools(output, task_id)
-    
-    # Publish message notification
-    r.publish(f'task_messages:{task_id}', json.dumps({
+    # Store the response and publish the notification in one round-trip
+    pipe = r.pipeline(transaction=False)
+    pipe.delete(api_call_key)
+    pipe.json().set(task_data_key, '$.last_usage', usage)
+    pipe.json().arrappend(task_key, turn_path, assistant_message)
+    pipe.publish(f'task_messages:{task_id}', orjson.dumps({
+        'type': 'append',
         'task_id': task_id,
         'turn_number': current_turn_index,
         'message_number': message_number,
         'message_type': 'assistant',
         'timestamp': time.time(),
-        'stop_reason': stop_reason
+        'stop_reason': stop_reason,
+        'messages': [assistant_message]
     }))
+    pipe.execute()
+    task_data['last_usage'] = usage
+    conversation[current_turn_index]['messages'].append(assistant_message)
+
+    if stop_reason == 'tool_use':
+        print(f"[CORE] Executing tools for {task_id}")
+        execute_tools(output, task_id)
 
     turn_ending = stop_reason not in ['tool_use', 'max_tokens']
     if turn_ending:
         print(f"[CORE] {task_id} TURN {current_turn_index} ENDING. Summarizing...")
         last_req_time, throttle_multiplier = summarize_and_store_turn(
-            task_id, r, bedrock, current_turn_index, last_req_time, throttle_multiplier
+            task_id, r, bedrock, task_data, conversation, current_turn_index, last_req_time, throttle_multiplier
         )
 
     return turn_ending
 
-def summarize_and_store_turn(task_id, r, bedrock, current_turn_index, last_req_time, throttle_multiplier):
+def summarize_and_store_turn(task_id, r, bedrock, task_data, conversation, current_turn_index, last_req_time, throttle_multiplier):
     """Generate and store a summary of the completed turn"""
-    conversation = r.json().get(f'task:{task_id}')
     turn_data = conversation[current_turn_index]
     turn_messages = turn_data.get('messages', [])
     
@@ -247,7 +315,6 @@ def summarize_and_store_turn(task_id, r, bedrock, current_turn_index, last_req_t
     }]
     
     # Get model from task_data
-    task_data = r.json().get(f'task_data:{task_id}')
     model_arn = task_data['model_name']
     
     # Build system prompt for summarization
@@ -274,6 +341,7 @@ def summarize_and_store_turn(task_id, r, bedrock, current_turn_index, last_req_t
     
     # Store summary in turn data
     r.json().set(f'task:{task_id}', f'$[{current_turn_index}].turn_summary', summary)
+    turn_data['turn_summary'] = summary
     
     return new_last_req_time, new_throttle_multiplier
 
@@ -290,83 +358,99 @@ def notify_parent_of_completion(task_id, r):
 def run_agent(task_id, max_iterations=250):
     """Main agent loop"""
     my_pid = os.getpid()
-    bedrock = boto3.client('bedrock-runtime')
-    r = redis.Redis(decode_responses=True)
-    task_data = r.json().get(f'task_data:{task_id}')
-    parent_task_id = task_data.get('parent_task_id')
-
-    # Only root task is responsible for cleanup
-    if parent_task_id is None:
-        cleanup_task_statuses(r)
-
-    # Check if task is still running
-    status, pid, _ = check_task_activity(task_id)
-    if status and pid == my_pid:
-        print(f"[CORE] Task {task_id} is still running, exiting")
-        return
+    bedrock = _BEDROCK
+    r = get_redis()
+    did_work = False
+    current_turn_index = 0
+    conversation = None
+    try:
+        task_data = r.json().get(f'task_data:{task_id}')
+        parent_task_id = task_data.get('parent_task_id')
 
-    conversation = r.json().get(f'task:{task_id}')
-    if conversation and isinstance(conversation, list):
-        current_turn_index = len(conversation) - 1
-    else:
-        current_turn_index = 0
+        # Only root task is responsible for cleanup
+        if parent_task_id is None:
+            cleanup_task_statuses(r)
+        last_cleanup = time.monotonic()
 
-    print(f"\n[CORE] Starting turn {current_turn_index} for {task_id}")
+        # Exit if another live agent process already owns this task
+        status, pid, _ = check_task_activity(task_id, use_cache=False)
+        if status and pid != my_pid:
+            print(f"[CORE] Task {task_id} is still running as PID {pid}, exiting")
+            return
 
-    r.json().set(f'task_data:{task_id}', '$.pid', my_pid)
-    
-    # Subscribe to throttle state
-    model_arn = task_data['model_name']
-    pubsub = r.pubsub()
-    pubsub.subscribe(f'throttle_state:{model_arn}')
+        conversation = r.json().get(f'task:{task_id}')
+        if conversation and isinstance(conversation, list):
+            current_turn_index = len(conversation) - 1
+        else:
+            current_turn_index = 0
+            conversation = [{'turn_number': 0, 'messages': [], 'started_at': time.time()}]
 
-    did_work = False
-    
-    for iteration in range(max_iterations):
-        # Root task cleans up statuses each iteration
-        if parent_task_id is None:
-            cleanup_task_statuses(r)
-        system_message = get_system_message(iteration, max_iterations)
+        print(f"\n[CORE] Starting turn {current_turn_index} for {task_id}")
 
-        queue = r.json().get(f'task_queue:{task_id}')
-        print(f"[CORE] Iteration {iteration}: queue length = {len(queue) if queue else 0}")
-    
-        if not queue or len(queue) == 0:
-            print(f"[CORE] Breaking: queue empty at iteration {iteration}")
-            break
+        r.json().set(f'task_data:{task_id}', '$.pid', my_pid)
+        
+        # Subscribe to throttle state
+        model_arn = task_data['model_name']
+        pubsub = r.pubsub()
+        pubsub.subscribe(f'throttle_state:{model_arn}')
+        
+        for iteration in range(max_iterations):
+            # Root task periodically cleans up statuses
+            if parent_task_id is None and time.monotonic() - last_cleanup > CLEANUP_INTERVAL:
+                cleanup_task_statuses(r)
+                last_cleanup = time.monotonic()
+            system_message = get_system_message(iteration, max_iterations)
+
+            queue_length = get_queue_length(task_id, r)
+            print(f"[CORE] Iteration {iteration}: queue length = {queue_length}")
+        
+            if queue_length == 0:
+                print(f"[CORE] Breaking: queue empty at iteration {iteration}")
+                break
 
-        print(f"[CORE] Calling execute_iteration for iteration {iteration}")
-        turn_ending = execute_iteration(task_id, r, bedrock, system_message)
-        did_work = True
-    
-        print(f"[CORE] Iteration {iteration} complete: turn_ending={turn_ending}")
+            print(f"[CORE] Calling execute_iteration for iteration {iteration}")
+            turn_ending = execute_iteration(task_id, r, bedrock, task_data, conversation, system_message)
+            did_work = True
         
-        if turn_ending:
-            # Check if there are more messages in the queue; keep going if so, otherwise break
-            queue = r.json().get(f'task_queue:{task_id}')
-            if queue and len(queue) > 0:
-                print(f"[CORE] Turn ended but queue has {len(queue)} messages, continuing...")
-                continue
-            print(f"[CORE] Breaking: turn ending at iteration {iteration}")
-            break
-
-    print(f"[CORE] Agent {task_id} finished")
-
-    if did_work:
-        notify_parent_of_completion(task_id, r)
-        num_messages = len(r.json().get(f'task:{task_id}')[current_turn_index].get('messages', []))
-        if task_data.get('pid') == my_pid:
-            r.json().set(f'task_data:{task_id}', '$.pid', None)
-            r.json().set(f'task_data:{task_id}', '$.status', 'stopped')
-            r.publish(f'task_messages:{task_id}', json.dumps({
+            print(f"[CORE] Iteration {iteration} complete: turn_ending={turn_ending}")
+            
+            if turn_ending:
+                # Check if there are more messages in the queue; keep going if so, otherwise break
+                queue_length = get_queue_length(task_id, r)
+                if queue_length > 0:
+                    print(f"[CORE] Turn ended but queue has {queue_length} messages, continuing...")
+                    continue
+                print(f"[CORE] Breaking: turn ending at iteration {iteration}")
+                break
+
+        print(f"[CORE] Agent {task_id} finished")
+
+        if did_work:
+            notify_parent_of_completion(task_id, r)
+    finally:
+        release_task(task_id, r, my_pid, did_work, conversation, current_turn_index)
+
+def release_task(task_id, r, my_pid, did_work, conversation, current_turn_index):
+    """Mark the task stopped if this process still owns it, always dropping its cached liveness probe"""
+    task_data_key = f'task_data:{task_id}'
+    owns_task = r.json().get(task_data_key, '$.pid') == [my_pid]
+    
+    # One MULTI, so no probe can re-cache 'running' between clearing the pid and dropping the cache
+    pipe = r.pipeline(transaction=True)
+    pipe.delete(f'status_cache:{task_id}')
+    if owns_task:
+        pipe.json().set(task_data_key, '$.pid', None)
+        pipe.json().set(task_data_key, '$.status', 'stopped')
+        pipe.delete(f'task_api_call:{task_id}')
+        if did_work and conversation:
+            pipe.publish(f'task_messages:{task_id}', json.dumps({
                 'task_id': task_id,
                 'turn_number': current_turn_index,
-                'message_number': num_messages,
+                'message_number': len(conversation[current_turn_index].get('messages', [])),
                 'message_type': 'completion',
                 'timestamp': time.time()
             }))
-    
-    r.delete(f'task_api_call:{task_id}')
+    pipe.execute()
 
 
 if __name__ == '__main__':
@@ -2,9 +2,21 @@
 """System prompt building for MicroCore agents"""
 
 from datetime import datetime
-import redis
+from functools import lru_cache
+import io
+import json
 
-def transcribe(task_id, r, include_tool_details=False):
+TRANSCRIPTION_CACHE_TTL = 300
+
+def _elide_middle(text, head_chars, tail_chars):
+   """Keep the first head_chars and last tail_chars of text, replacing the rest with a marker"""
+   if head_chars is None or tail_chars is None or len(text) <= head_chars + tail_chars:
+      return text
+   elided = len(text) - head_chars - tail_chars
+   tail = text[-tail_chars:] if tail_chars else ''
+   return f"{text[:head_chars]}\n\n...[{elided} characters elided]...\n\n{tail}"
+
+def transcribe(task_id, r, include_tool_details=False, head_chars=None, tail_chars=None):
    """
    Transcribe a task's conversation history into readable text format.
     
@@ -13,6 +25,8 @@ def transcribe(task_id, r, include_tool_details=False):
       r: Redis connection
       include_tool_details: If True, include full tool use/result details. 
                             If False, replace with [Used {tool_name} tool] and omit results.
+      head_chars, tail_chars: If both are given, keep only this many characters from the
+                              start and end of the transcription and elide the middle.
     
    Returns:
       String containing the transcribed conversation
@@ -21,7 +35,10 @@ def transcribe(task_id, r, include_tool_details=False):
    if not conversation:
       return f"No conversation found for task {task_id}"
     
-   lines = []
+   # Entries are separated by a blank line; the trailing separator is dropped at the end
+   buf = io.StringIO()
+   write = buf.write
+   dumps = json.dumps
     
    for turn in conversation:
       messages = turn.get('messages', [])
@@ -34,7 +51,7 @@ def transcribe(task_id, r, include_tool_details=False):
             # Extract user messages
             for item in content:
                if 'text' in item:
-                  lines.append(f"User: {item['text']}")
+                  write(f"User: {item['text']}\n\n")
                elif 'toolResult' in item:
                   if include_tool_details:
                      tool_result = item['toolResult']
@@ -44,7 +61,9 @@ def transcribe(task_id, r, include_tool_details=False):
                      for res in result_content:
                         if 'text' in res:
                            result_text = res['text']
-                     lines.append(f"Tool Result ({tool_use_id}): {result_text}")
+                        elif 'json' in res:
+                           result_text = dumps(res['json'])
+                     write(f"Tool Result ({tool_use_id}): {result_text}\n\n")
                   # else: omit tool results
             
          elif role == 'assistant':
@@ -61,7 +80,7 @@ def transcribe(task_id, r, include_tool_details=False):
             # Output text first
             if text_parts:
                combined_text = ' '.join(text_parts)
-               lines.append(f"Assistant: {combined_text}")
+               write(f"Assistant: {combined_text}\n\n")
                
             # Then tool uses
             for tool_use in tool_uses:
@@ -69,14 +88,52 @@ def transcribe(task_id, r, include_tool_details=False):
                   
                if include_tool_details:
                   tool_input = tool_use.get('input', {})
-                  import json
-                  args_str = json.dumps(tool_input, indent=2)
-                  lines.append(f"Tool Use: {tool_name}")
-                  lines.append(f"  Input: {args_str}")
+                  args_str = dumps(tool_input, indent=2)
+                  write(f"Tool Use: {tool_name}\n\n")
+                  write(f"  Input: {args_str}\n\n")
                else:
-                  lines.append(f"Assistant: [Used {tool_name} tool]")
+                  write(f"Assistant: [Used {tool_name} tool]\n\n")
+    
+   return _elide_middle(buf.getvalue()[:-2], head_chars, tail_chars)
+
+def transcribe_cached(task_id, r, include_tool_details=False, head_chars=None, tail_chars=None):
+   """
+   Transcribe a task's conversation, reusing a cached transcription while it is unchanged.
+    
+   Each (task, options) pair has a single cache hash holding the transcription and
+   the conversation version it was built from (number of turns and number of messages
+   in the last turn). Any appended message changes the version, and the next miss
+   overwrites the entry in place, so stale copies never pile up.
+    
+   Args:
+      task_id: The task ID to transcribe
+      r: Redis connection (decode_responses=True)
+      include_tool_details, head_chars, tail_chars: Passed through to transcribe
+    
+   Returns:
+      String containing the transcribed conversation
+   """
+   conv_key = f'task:{task_id}'
+   cache_key = f'transcription_cache:{task_id}:{int(include_tool_details)}:{head_chars}:{tail_chars}'
+   pipe = r.pipeline(transaction=False)
+   pipe.json().arrlen(conv_key, '$')
+   pipe.json().arrlen(conv_key, '$[-1].messages')
+   pipe.hmget(cache_key, 'version', 'text')
+   num_turns, num_messages, (cached_version, cached_text) = pipe.execute(raise_on_error=False)
+   if isinstance(num_turns, Exception) or isinstance(num_messages, Exception) or not num_turns or not num_messages:
+      # No conversation to cache
+      return transcribe(task_id, r, include_tool_details, head_chars, tail_chars)
+    
+   version = f'{num_turns[0]}:{num_messages[0]}'
+   if cached_version == version and cached_text is not None:
+      return cached_text
     
-   return '\n\n'.join(lines)
+   transcription = transcribe(task_id, r, include_tool_details, head_chars, tail_chars)
+   pipe = r.pipeline(transaction=True)
+   pipe.hset(cache_key, mapping={'version': version, 'text': transcription})
+   pipe.expire(cache_key, TRANSCRIPTION_CACHE_TTL)
+   pipe.execute()
+   return transcription
 
 def build_static_system_prompt(model_name, parent_task_id=None):
    """Build static portion of system prompt
@@ -85,6 +142,14 @@ def build_static_system_prompt(model_name, parent_task_id=None):
       model_name: Model ARN or name
       parent_task_id: If provided, this is a child task; if None, this is root
    """
+   prompt = _build_static_system_prompt(model_name, parent_task_id is None)
+   if parent_task_id is not None:
+      prompt = prompt.replace('{parent_task_id}', parent_task_id)
+   return prompt
+
+@lru_cache(maxsize=None)
+def _build_static_system_prompt(model_name, is_root):
+   """Build the static prompt for a root or child task, with a {parent_task_id} placeholder for children"""
    base = """You are MitoNova, a master orchestration agent.
 
 CORE PRINCIPLES:
@@ -128,7 +193,7 @@ Always use /work/agent_mount for persistent storage paths.
 """
     
    # Add task hierarchy information
-   if parent_task_id is None:
+   if is_root:
       base += """TASK HIERARCHY: You are the ROOT task.
 
 ROOT TASK RESPONSIBILITIES:
@@ -171,7 +236,7 @@ EXCEPTIONS TO NORMAL OPERATING MODE:
 
 """
    else:
-      base += f"""TASK HIERARCHY: You are a CHILD task. Parent task ID: {parent_task_id}
+      base += """TASK HIERARCHY: You are a CHILD task. Parent task ID: {parent_task_id}
 You can query your parent's conversation using the query_task tool.
 
 CHILD TASK RESPONSIBILITIES:
@@ -208,16 +273,15 @@ WHEN NOT TO SPAWN SUB-TASKS (CHILD):
     
    return base
 
-def build_dynamic_system_prompt(task_data, turn_number):
+def build_dynamic_system_prompt(task_data, turn_number, r):
    """Build dynamic portion of system prompt
     
    Args:
       task_data: Task data dictionary
       turn_number: Current turn number
+      r: Redis connection
    """
     
-   r = redis.Redis(decode_responses=True)
-    
    # Calculate current token count from task_data
    total_input_tokens = 0
    total_output_tokens = 0
@@ -240,7 +304,7 @@ Tokens used: {total_tokens:,} (input: {total_input_tokens:,}, output: {total_out
    parent_task_id = task_data.get('parent_task_id')
         
    if parent_task_id:   
-      parent_transcription = transcribe(parent_task_id, r, include_tool_details=True)
+      parent_transcription = transcribe_cached(parent_task_id, r, include_tool_details=True)
         
       dynamic += f"""
 
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""run_agent's startup guard: exit only when another live process owns the task"""
+
+import os
+import sys
+from pathlib import Path
+from unittest.mock import MagicMock
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+
+core = pytest.importorskip("core")
+
+MY_PID = 1111
+OTHER_PID = 4242
+
+
+@pytest.fixture
+def agent(monkeypatch):
+    r = MagicMock()
+    r.json().get.return_value = {'parent_task_id': 'root', 'model_name': 'arn:model'}
+    execute_iteration = MagicMock()
+    release_task = MagicMock()
+    monkeypatch.setattr(core, 'get_redis', lambda: r)
+    monkeypatch.setattr(core.os, 'getpid', lambda: MY_PID)
+    monkeypatch.setattr(core, 'get_queue_length', lambda task_id, r: 0)
+    monkeypatch.setattr(core, 'execute_iteration', execute_iteration)
+    monkeypatch.setattr(core, 'release_task', release_task)
+    return r, execute_iteration, release_task
+
+
+def test_exits_when_another_process_owns_task(agent, monkeypatch):
+    r, execute_iteration, release_task = agent
+    monkeypatch.setattr(core, 'check_task_activity', lambda task_id, use_cache=True: (True, OTHER_PID, None))
+
+    core.run_agent('task_1')
+
+    r.json().set.assert_not_called()
+    r.pubsub.assert_not_called()
+    execute_iteration.assert_not_called()
+    release_task.assert_called_once()
+    assert release_task.call_args.args[2] == MY_PID
+
+
+def test_runs_when_launcher_recorded_own_pid(agent, monkeypatch):
+    r, _, release_task = agent
+    monkeypatch.setattr(core, 'check_task_activity', lambda task_id, use_cache=True: (True, MY_PID, None))
+
+    core.run_agent('task_1')
+
+    r.json().set.assert_called_once_with('task_data:task_1', '$.pid', MY_PID)
+    r.pubsub.assert_called_once()
+    release_task.assert_called_once()
+
+
+def test_runs_when_task_is_not_alive(agent, monkeypatch):
+    r, _, _ = agent
+    monkeypatch.setattr(core, 'check_task_activity', lambda task_id, use_cache=True: (False, None, None))
+
+    core.run_agent('task_1')
+
+    r.json().set.assert_called_once_with('task_data:task_1', '$.pid', MY_PID)
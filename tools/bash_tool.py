@@ -1,7 +1,15 @@
 #!/usr/bin/env python3
 """Bash command execution tool"""
 
+import os
+import selectors
+import signal
 import subprocess
+import time
+
+TIMEOUT = 60
+MAX_OUTPUT_BYTES = 256 * 1024
+READ_CHUNK = 64 * 1024
 
 BASH_SPEC = {
     "toolSpec": {
@@ -19,12 +27,59 @@ BASH_SPEC = {
     }
 }
 
+def _kill(proc):
+    """Kill the command's whole process group"""
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+    proc.wait()
+
+def _decode(buf, dropped):
+    text = buf.decode(errors='replace')
+    if dropped:
+        text += f"\n...[truncated {dropped} bytes]"
+    return text
+
 def bash_tool(params, task_id):
-    """Execute bash command"""
+    """Execute bash command, keeping at most MAX_OUTPUT_BYTES of stdout and of stderr"""
     command = params['command']
-    result = subprocess.run(command, shell=True, capture_output=True, text=True, timeout=60)
+    proc = subprocess.Popen(command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, start_new_session=True)
+    deadline = time.monotonic() + TIMEOUT
+
+    # Keep draining past the cap so the command never blocks on a full pipe
+    buffers = {proc.stdout: bytearray(), proc.stderr: bytearray()}
+    dropped = {proc.stdout: 0, proc.stderr: 0}
+
+    with selectors.DefaultSelector() as selector:
+        for stream in buffers:
+            selector.register(stream, selectors.EVENT_READ)
+        while selector.get_map():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                _kill(proc)
+                raise subprocess.TimeoutExpired(command, TIMEOUT)
+            for key, _ in selector.select(remaining):
+                chunk = os.read(key.fd, READ_CHUNK)
+                if not chunk:
+                    selector.unregister(key.fileobj)
+                    continue
+                buf = buffers[key.fileobj]
+                room = MAX_OUTPUT_BYTES - len(buf)
+                buf += chunk[:room]
+                dropped[key.fileobj] += max(0, len(chunk) - room)
+
+    try:
+        returncode = proc.wait(timeout=max(0, deadline - time.monotonic()))
+    except subprocess.TimeoutExpired:
+        _kill(proc)
+        raise
+    finally:
+        proc.stdout.close()
+        proc.stderr.close()
+
     return {
-        "stdout": result.stdout,
-        "stderr": result.stderr,
-        "returncode": result.returncode
+        "stdout": _decode(buffers[proc.stdout], dropped[proc.stdout]),
+        "stderr": _decode(buffers[proc.stderr], dropped[proc.stderr]),
+        "returncode": returncode
     }
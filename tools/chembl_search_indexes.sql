@@ -0,0 +1,25 @@
+-- Trigram indexes for chembl_search's substring matches (ILIKE '%term%').
+-- A B-tree can't serve a leading wildcard; a GIN trigram index can, so these
+-- turn the sequential scans into index lookups without changing results.
+--
+-- Run once against the ChEMBL database as a user allowed to create
+-- extensions and indexes:
+--   psql -d chembl_35 -f tools/chembl_search_indexes.sql
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE INDEX IF NOT EXISTS molecule_dictionary_chembl_id_trgm
+    ON molecule_dictionary USING gin (chembl_id gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS molecule_dictionary_pref_name_trgm
+    ON molecule_dictionary USING gin (pref_name gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS molecule_synonyms_synonyms_trgm
+    ON molecule_synonyms USING gin (synonyms gin_trgm_ops);
+
+CREATE INDEX IF NOT EXISTS target_dictionary_chembl_id_trgm
+    ON target_dictionary USING gin (chembl_id gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS target_dictionary_pref_name_trgm
+    ON target_dictionary USING gin (pref_name gin_trgm_ops);
+
+ANALYZE molecule_dictionary;
+ANALYZE molecule_synonyms;
+ANALYZE target_dictionary;
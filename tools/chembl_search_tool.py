@@ -1,7 +1,10 @@
 #!/usr/bin/env python3
 """ChEMBL database search tool"""
 
-import psycopg2
+import os
+import threading
+from psycopg2 import pool
+from .result_cache import cached_tool
 
 CHEMBL_SEARCH_SPEC = {
     "toolSpec": {
@@ -13,7 +16,8 @@ CHEMBL_SEARCH_SPEC = {
                 "properties": {
                     "query": {"type": "string", "description": "Search query (compound name, ChEMBL ID, etc.)"},
                     "entity_type": {"type": "string", "description": "Entity type: compound, target, drug (default: compound)"},
-                    "limit": {"type": "integer", "description": "Maximum results (default: 10)"}
+                    "limit": {"type": "integer", "description": "Maximum results (default: 10)"},
+                    "include_total": {"type": "boolean", "description": "Also count all matches, which is slower (default: false; total is then the number of results returned)"}
                 },
                 "required": ["query"]
             }
@@ -21,96 +25,97 @@ CHEMBL_SEARCH_SPEC = {
     }
 }
 
+# Idle connections kept open; matches core.MAX_TOOL_WORKERS, since any above this are closed on putconn
+POOL_MIN_CONN = int(os.getenv('CHEMBL_POOL_MIN_CONN', 8))
+POOL_MAX_CONN = max(16, POOL_MIN_CONN)
+
+_POOL = None
+_POOL_LOCK = threading.Lock()
+
+def _get_pool():
+    """Create the shared connection pool on first use"""
+    global _POOL
+    if _POOL is None:
+        with _POOL_LOCK:
+            if _POOL is None:
+                _POOL = pool.ThreadedConnectionPool(POOL_MIN_CONN, POOL_MAX_CONN, host='localhost', dbname='chembl_35', user='agent', password='agent', port=5432)
+    return _POOL
+
+@cached_tool
 def chembl_search_tool(params, task_id):
-    """Search ChEMBL database"""
+    """Search ChEMBL database
+    
+    Matches are substring ILIKEs; chembl_search_indexes.sql creates the trigram
+    indexes that keep them off sequential scans.
+    """
     query = params['query']
     entity_type = params.get('entity_type', 'compound')
     limit = params.get('limit', 10)
+    include_total = params.get('include_total', False)
     
-    conn = psycopg2.connect(host='localhost', dbname='chembl_35', user='agent', password='agent', port=5432)
-    cursor = conn.cursor()
+    # Counting every match forces Postgres past LIMIT, so only do it on request
+    count_column = ", COUNT(*) OVER() AS total_count" if include_total else ""
+    query_params = {'term': f"%{query}%", 'limit': limit}
     
-    search_term = f"%{query}%"
-    
-    if entity_type == 'compound':
-        cursor.execute("""
-            SELECT md.chembl_id, md.pref_name, cs.canonical_smiles,
-                   cp.full_mwt, cp.alogp, cp.hba, cp.hbd, cp.psa
-            FROM molecule_dictionary md
-            LEFT JOIN compound_structures cs ON md.molregno = cs.molregno
-            LEFT JOIN compound_properties cp ON md.molregno = cp.molregno
-            LEFT JOIN molecule_synonyms ms ON md.molregno = ms.molregno
-            WHERE md.chembl_id ILIKE %s
-            OR md.pref_name ILIKE %s
-            OR ms.synonyms ILIKE %s
-            GROUP BY md.chembl_id, md.pref_name, cs.canonical_smiles,
-                     cp.full_mwt, cp.alogp, cp.hba, cp.hbd, cp.psa
-            LIMIT %s
-        """, (search_term, search_term, search_term, limit))
-        rows = cursor.fetchall()
-        columns = [desc[0] for desc in cursor.description]
-        
-        cursor.execute("""
-            SELECT COUNT(DISTINCT md.molregno)
-            FROM molecule_dictionary md
-            LEFT JOIN molecule_synonyms ms ON md.molregno = ms.molregno
-            WHERE md.chembl_id ILIKE %s
-            OR md.pref_name ILIKE %s
-            OR ms.synonyms ILIKE %s
-        """, (search_term, search_term, search_term))
-        total = cursor.fetchone()[0]
+    db_pool = _get_pool()
+    conn = db_pool.getconn()
+    try:
+        # Server-side cursor: rows are streamed and only `limit` of them are fetched
+        with conn.cursor(name=f'chembl_{task_id}') as cursor:
+            cursor.itersize = max(1, min(limit, 100))
+            if entity_type == 'compound':
+                cursor.execute(f"""
+                    SELECT md.chembl_id, md.pref_name, cs.canonical_smiles,
+                           cp.full_mwt, cp.alogp, cp.hba, cp.hbd, cp.psa{count_column}
+                    FROM molecule_dictionary md
+                    LEFT JOIN compound_structures cs ON md.molregno = cs.molregno
+                    LEFT JOIN compound_properties cp ON md.molregno = cp.molregno
+                    WHERE md.chembl_id ILIKE %(term)s
+                    OR md.pref_name ILIKE %(term)s
+                    OR EXISTS (SELECT 1 FROM molecule_synonyms ms
+                               WHERE ms.molregno = md.molregno AND ms.synonyms ILIKE %(term)s)
+                    LIMIT %(limit)s
+                """, query_params)
         
-    elif entity_type == 'target':
-        cursor.execute("""
-            SELECT td.chembl_id, td.pref_name, td.target_type, td.organism
-            FROM target_dictionary td
-            WHERE td.chembl_id ILIKE %s
-            OR td.pref_name ILIKE %s
-            LIMIT %s
-        """, (search_term, search_term, limit))
-        rows = cursor.fetchall()
-        columns = [desc[0] for desc in cursor.description]
+            elif entity_type == 'target':
+                cursor.execute(f"""
+                    SELECT td.chembl_id, td.pref_name, td.target_type, td.organism{count_column}
+                    FROM target_dictionary td
+                    WHERE td.chembl_id ILIKE %(term)s
+                    OR td.pref_name ILIKE %(term)s
+                    LIMIT %(limit)s
+                """, query_params)
         
-        cursor.execute("""
-            SELECT COUNT(*)
-            FROM target_dictionary td
-            WHERE td.chembl_id ILIKE %s
-            OR td.pref_name ILIKE %s
-        """, (search_term, search_term))
-        total = cursor.fetchone()[0]
+            elif entity_type == 'drug':
+                cursor.execute(f"""
+                    SELECT md.chembl_id, md.pref_name, cs.canonical_smiles,
+                           md.max_phase, md.first_approval, md.oral{count_column}
+                    FROM molecule_dictionary md
+                    LEFT JOIN compound_structures cs ON md.molregno = cs.molregno
+                    WHERE (md.chembl_id ILIKE %(term)s
+                    OR md.pref_name ILIKE %(term)s
+                    OR EXISTS (SELECT 1 FROM molecule_synonyms ms
+                               WHERE ms.molregno = md.molregno AND ms.synonyms ILIKE %(term)s))
+                    AND md.max_phase >= 1
+                    ORDER BY md.max_phase DESC
+                    LIMIT %(limit)s
+                """, query_params)
         
-    elif entity_type == 'drug':
-        cursor.execute("""
-            SELECT md.chembl_id, md.pref_name, cs.canonical_smiles,
-                   md.max_phase, md.first_approval, md.oral
-            FROM molecule_dictionary md
-            LEFT JOIN compound_structures cs ON md.molregno = cs.molregno
-            LEFT JOIN molecule_synonyms ms ON md.molregno = ms.molregno
-            WHERE (md.chembl_id ILIKE %s
-            OR md.pref_name ILIKE %s
-            OR ms.synonyms ILIKE %s)
-            AND md.max_phase >= 1
-            GROUP BY md.chembl_id, md.pref_name, cs.canonical_smiles,
-                     md.max_phase, md.first_approval, md.oral
-            ORDER BY md.max_phase DESC
-            LIMIT %s
-        """, (search_term, search_term, search_term, limit))
-        rows = cursor.fetchall()
-        columns = [desc[0] for desc in cursor.description]
-        
-        cursor.execute("""
-            SELECT COUNT(DISTINCT md.molregno)
-            FROM molecule_dictionary md
-            LEFT JOIN molecule_synonyms ms ON md.molregno = ms.molregno
-            WHERE (md.chembl_id ILIKE %s
-            OR md.pref_name ILIKE %s
-            OR ms.synonyms ILIKE %s)
-            AND md.max_phase >= 1
-        """, (search_term, search_term, search_term))
-        total = cursor.fetchone()[0]
-    
-    cursor.close()
-    conn.close()
+            rows = cursor.fetchmany(limit)
+            columns = [desc[0] for desc in cursor.description]
+            if include_total:
+                # Strip the trailing total_count column
+                columns = columns[:-1]
+                total = rows[0][-1] if rows else 0
+                rows = [row[:-1] for row in rows]
+            else:
+                total = len(rows)
+    except Exception:
+        # Don't hand a connection in a failed transaction back to the pool
+        conn.rollback()
+        raise
+    finally:
+        db_pool.putconn(conn)
     
     results = [dict(zip(columns, row)) for row in rows]
     
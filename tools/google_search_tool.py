@@ -3,6 +3,19 @@
 
 import os
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from .result_cache import cached_tool
+
+# Keep-alive session so repeated searches reuse the TLS connection
+_SESSION = requests.Session()
+_SESSION.mount('https://', HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=16,
+    max_retries=Retry(total=2, backoff_factor=0.2, status_forcelist=[429, 500, 502, 503, 504])
+))
+
+_RESULT_KEYS = ('title', 'link', 'snippet')
 
 GOOGLE_SEARCH_SPEC = {
     "toolSpec": {
@@ -27,6 +40,7 @@ GOOGLE_SEARCH_SPEC = {
     }
 }
 
+@cached_tool
 def google_search_tool(params, task_id):
     """Search Google and return results"""
     query = params['query']
@@ -35,28 +49,23 @@ def google_search_tool(params, task_id):
     api_key = os.environ['GOOGLE_API_KEY']
     search_engine_id = os.environ['GOOGLE_SEARCH_ENGINE_ID']
     
-    response = requests.get(
+    response = _SESSION.get(
         "https://www.googleapis.com/customsearch/v1",
         params={
             'key': api_key,
             'cx': search_engine_id,
             'q': query,
             'num': min(limit, 10)
-        }
+        },
+        timeout=(3, 10)
     )
+    response.raise_for_status()
     data = response.json()
     
     items = data.get('items', [])
     total = int(data.get('searchInformation', {}).get('totalResults', '0'))
     
-    results = [
-        {
-            "title": item.get('title', ''),
-            "link": item.get('link', ''),
-            "snippet": item.get('snippet', '')
-        }
-        for item in items
-    ]
+    results = [{key: item.get(key, '') for key in _RESULT_KEYS} for item in items]
     
     return {
         "results": results,
@@ -1,7 +1,16 @@
 #!/usr/bin/env python3
 """PubMed and PubMed Central search via Elasticsearch"""
 
+import threading
+import orjson
 from elasticsearch import Elasticsearch
+from elasticsearch.serializer import JSONSerializer
+from .result_cache import cached_tool
+
+ES_HOSTS = ["http://host.docker.internal:9200", "http://localhost:9200"]
+
+# Matches the index.highlight.max_analyzed_offset default; longer texts are cut instead of failing the query
+HIGHLIGHT_MAX_ANALYZED_OFFSET = 1000000
 
 PUBMED_SEARCH_SPEC = {
     "toolSpec": {
@@ -12,7 +21,8 @@ PUBMED_SEARCH_SPEC = {
                 "type": "object",
                 "properties": {
                     "query": {"type": "string", "description": "Search query string"},
-                    "limit": {"type": "integer", "description": "Max results (default: 10)"}
+                    "limit": {"type": "integer", "description": "Max results (default: 10)"},
+                    "include_total": {"type": "boolean", "description": "Also count all matching articles, which is slower (default: false; total is then the number of results returned)"}
                 },
                 "required": ["query"]
             }
@@ -20,19 +30,59 @@ PUBMED_SEARCH_SPEC = {
     }
 }
 
+class ORJSONSerializer(JSONSerializer):
+    """JSON serializer backed by orjson; PMC responses are large enough for stdlib json to dominate"""
+
+    def loads(self, data):
+        return orjson.loads(data)
+
+    def dumps(self, data):
+        if isinstance(data, (str, bytes)):
+            return super().dumps(data)
+        return orjson.dumps(data, default=self.default)
+
+_ES = None
+_ES_LOCK = threading.Lock()
+
+def _get_es():
+    """Create the shared Elasticsearch client on first use"""
+    global _ES
+    if _ES is None:
+        with _ES_LOCK:
+            if _ES is None:
+                _ES = Elasticsearch(ES_HOSTS, serializer=ORJSONSerializer(), request_timeout=30, retry_on_timeout=True, max_retries=2, http_compress=True)
+    return _ES
+
+@cached_tool
 def pubmed_search_tool(params, task_id):
     """Search PubMed and PMC"""
     query = params['query']
     limit = params.get('limit', 10)
+    include_total = params.get('include_total', False)
     
-    hosts = ["http://host.docker.internal:9200", "http://localhost:9200"]
-    es = Elasticsearch(hosts, request_timeout=30)
+    es = _get_es()
     
-    search_query = {"query_string": {"query": query}}
-    search_results = es.search(index="pubmed,pubmedcentral", body={"query": search_query, "size": limit})
+    # Fetch only the fields we return; PMC full text is reduced to a server-side snippet
+    search_body = {
+        "query": {"query_string": {"query": query}},
+        "size": limit,
+        "_source": {"includes": ["pmid", "pmcid", "article_title", "abstract"]},
+        "highlight": {
+            "pre_tags": [""],
+            "post_tags": [""],
+            "max_analyzed_offset": HIGHLIGHT_MAX_ANALYZED_OFFSET,
+            "fields": {"content": {"fragment_size": 500, "number_of_fragments": 1, "no_match_size": 500}}
+        },
+        "track_total_hits": include_total
+    }
+    search_results = es.search(index="pubmed,pubmedcentral", body=search_body)
     
     hits = search_results["hits"]["hits"]
-    total = search_results["hits"]["total"]["value"] if isinstance(search_results["hits"]["total"], dict) else search_results["hits"]["total"]
+    total = search_results["hits"].get("total")
+    if total is None:
+        total = len(hits)
+    elif isinstance(total, dict):
+        total = total["value"]
     
     results = []
     for hit in hits:
@@ -45,11 +95,12 @@ def pubmed_search_tool(params, task_id):
                 "source": "PubMed"
             })
         elif "pmcid" in source:
-            content = source.get("content", "")
+            # Either the best-matching fragment or, if content didn't match, its first 500 chars
+            snippet = hit.get("highlight", {}).get("content", [""])[0]
             results.append({
                 "id": str(source.get('pmcid', 'unknown')),
                 "title": "Full text article",
-                "abstract": content[:500] + "..." if len(content) > 500 else content,
+                "abstract": snippet,
                 "source": "PubMed Central"
             })
         else:
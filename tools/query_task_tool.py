@@ -4,18 +4,40 @@
 
 import sys
 import os
-import json
+import threading
 import boto3
-import redis
+from botocore.config import Config
 from dotenv import load_dotenv
 
 # Add parent directory to path to import utils
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from utils import call_llm_api, build_llm_input, resolve_model, check_task_activity
-from prompts import transcribe
+from utils import call_llm_api, build_llm_input, resolve_model, check_task_activity, get_redis
+from prompts import transcribe_cached
 
 load_dotenv()
 
+# Transcript bounds so long-running tasks don't inflate every query prompt
+TRANSCRIPT_HEAD_CHARS = 2000
+TRANSCRIPT_TAIL_CHARS = 8000
+
+_BEDROCK = None
+_BEDROCK_LOCK = threading.Lock()
+
+QUERY_SYSTEM_PROMPT = "You are a helpful assistant analyzing task conversations."
+
+QUERY_PROMPT_TEMPLATE = """You are analyzing a task's conversation history and status.
+
+Task ID: {task_id}
+Current Status: {status}
+PID: {pid}
+
+Conversation Transcript:
+{transcript}
+
+Question: {question}
+
+Please answer the question based on the conversation transcript and task status above."""
+
 QUERY_TASK_SPEC = {
     "toolSpec": {
         "name": "query_task",
@@ -44,14 +66,27 @@ QUERY_TASK_SPEC = {
 }
 
 
+def _get_bedrock():
+    """Create the shared Bedrock runtime client on first use"""
+    global _BEDROCK
+    if _BEDROCK is None:
+        with _BEDROCK_LOCK:
+            if _BEDROCK is None:
+                _BEDROCK = boto3.client(
+                    'bedrock-runtime',
+                    region_name=os.getenv('AWS_REGION', 'us-east-1'),
+                    config=Config(max_pool_connections=16, retries={'max_attempts': 3, 'mode': 'adaptive'})
+                )
+    return _BEDROCK
+
+
 def query_task_tool(params, task_id):
     """Query a task's conversation and status"""
     target_task_id = params['task_id']
     question = params['question']
     model = params.get('model', 'sonnet45')
     
-    # Connect to Redis
-    r = redis.Redis(host='localhost', port=6379, decode_responses=True)
+    r = get_redis()
     
     # Get task data
     task_data = r.json().get(f'task_data:{target_task_id}')
@@ -59,28 +94,24 @@ def query_task_tool(params, task_id):
         return {"error": f"Task {target_task_id} not found"}
     
     # Get task status
-    is_alive, pid, cpu_percent = check_task_activity(target_task_id)
-    cpu_percent = cpu_percent or 0
+    is_alive, pid, _ = check_task_activity(target_task_id)
     
     # Get conversation transcript
-    transcript = transcribe(target_task_id, r, include_tool_details=True)
+    transcript = transcribe_cached(
+        target_task_id, r, include_tool_details=True,
+        head_chars=TRANSCRIPT_HEAD_CHARS, tail_chars=TRANSCRIPT_TAIL_CHARS
+    )
 
     status = "running" if is_alive else "stopped"
     
     # Build prompt
-    prompt = f"""You are analyzing a task's conversation history and status.
-
-Task ID: {target_task_id}
-Current Status: {status}
-PID: {pid}
-CPU Usage: {cpu_percent:.1f}%
-
-Conversation Transcript:
-{transcript}
-
-Question: {question}
-
-Please answer the question based on the conversation transcript and task status above."""
+    prompt = QUERY_PROMPT_TEMPLATE.format(
+        task_id=target_task_id,
+        status=status,
+        pid=pid,
+        transcript=transcript,
+        question=question
+    )
     
     # Resolve model ARN
     model_arn = resolve_model(model, r)
@@ -97,17 +128,14 @@ Please answer the question based on the conversation transcript and task status
     input_params = build_llm_input(
         model_arn=model_arn,
         bedrock_messages=bedrock_messages,
-        full_system_prompt="You are a helpful assistant analyzing task conversations.",
+        full_system_prompt=QUERY_SYSTEM_PROMPT,
         tool_schemas=[],  
         #system_message=None
     )
     
-    # Create Bedrock client
-    bedrock = boto3.client('bedrock-runtime', region_name=os.getenv('AWS_REGION', 'us-east-1'))
-    
     # Call LLM API
     response, _, _ = call_llm_api(
-        bedrock=bedrock,
+        bedrock=_get_bedrock(),
         input_params=input_params,
         task_id=task_id,  # Current task ID (the one calling this tool)
         r=r,
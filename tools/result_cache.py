@@ -0,0 +1,30 @@
+#!/usr/bin/env python3
+"""Short-lived result cache for the search tools"""
+
+import copy
+import json
+import threading
+from functools import wraps
+from cachetools import TTLCache
+
+_CACHE = TTLCache(maxsize=512, ttl=90)
+_LOCK = threading.Lock()
+
+def cached_tool(tool):
+    """Cache a tool's results by its params for a short TTL
+
+    Hits and stored entries are deep copies, so callers can't mutate cached results.
+    """
+    @wraps(tool)
+    def wrapper(params, task_id):
+        key = (tool.__name__, json.dumps(params, sort_keys=True))
+        with _LOCK:
+            hit = _CACHE.get(key)
+        if hit is not None:
+            return copy.deepcopy(hit)
+        
+        result = tool(params, task_id)
+        with _LOCK:
+            _CACHE[key] = copy.deepcopy(result)
+        return result
+    return wrapper
@@ -28,11 +28,11 @@ def spawn_task_tool(params, parent_task_id):
     in their system prompt, making spawn_task a conversation branch point. The child can 
     query the parent using query_task tool.
     """
-    import redis
     import time
-    from utils import launch_task_agent
+    from utils import launch_task_agent, get_redis
+    from prompts import transcribe_cached
 
-    r = redis.Redis(decode_responses=True)
+    r = get_redis()
     
     initial_message = params['initial_message']
     child_task_id = params.get('task_id')  # Optional: resume existing task
@@ -55,7 +55,7 @@ def spawn_task_tool(params, parent_task_id):
     
     messages = []
     if parent_conversation:
-        transcript = transcribe(parent_task_id, r)
+        transcript = transcribe_cached(parent_task_id, r)
         header = f"[SYSTEM]The following is a transcription of your parent task's conversation history. Use it to understand the context of the task:\n\n"
         footer = "\n\n[SYSTEM] Given the context above, you are now ready to begin your task:\n\n"
         messages.append({'role': 'user', 'content': [{'text': header + transcript + footer}]})
@@ -72,13 +72,17 @@ def spawn_task_tool(params, parent_task_id):
         start_process=True,
     )
 
-    # Get parent task's list of children and add new child task if needed
-    parent_children = r.json().get(f'task_data:{parent_task_id}.children')
-    if parent_children is None:
-        parent_children = []
-    if child_task_id not in parent_children:
-        parent_children.append(child_task_id)
-        r.json().set(f'task_data:{parent_task_id}.children', '$', parent_children)
+    # Append the child to the parent's children in one round-trip, undoing it if it was already listed
+    parent_key = f'task_data:{parent_task_id}'
+    pipe = r.pipeline()
+    pipe.json().arrindex(parent_key, '$.children', child_task_id)
+    pipe.json().arrappend(parent_key, '$.children', child_task_id)
+    child_index, _ = pipe.execute()
+    if not child_index:
+        # Parent predates the children field
+        r.json().set(parent_key, '$.children', [child_task_id])
+    elif child_index[0] != -1:
+        r.json().arrpop(parent_key, '$.children')
     
     if child_task_id:
         action = "Resumed"
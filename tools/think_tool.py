@@ -20,5 +20,5 @@ THINK_SPEC = {
 
 def think_tool(params, task_id):
     """Think and return conclusions"""
-    conclusions = params['conclusions']
-    return {"conclusions": conclusions}
+    # params is the toolUse input recorded in the conversation, so build a new dict rather than popping 'thoughts'
+    return {"conclusions": params['conclusions']}
@@ -6,7 +6,7 @@ import uuid
 import redis
 import time
 import json
-import copy
+import orjson
 import os
 from botocore.exceptions import ClientError as BotocoreClientError, ReadTimeoutError
 import psutil
@@ -18,6 +18,61 @@ from prompts import build_dynamic_system_prompt, build_static_system_prompt, tra
 dead_statuses = [psutil.STATUS_DEAD, psutil.STATUS_STOPPED, psutil.STATUS_ZOMBIE]
 good_statuses = [psutil.STATUS_RUNNING, psutil.STATUS_SLEEPING, psutil.STATUS_WAKING, psutil.STATUS_DISK_SLEEP, psutil.STATUS_IDLE]
 
+# Shared client for every helper here; blocks briefly instead of failing when all connections are busy
+_R = redis.Redis(connection_pool=redis.BlockingConnectionPool(max_connections=50, timeout=20, decode_responses=True))
+
+def get_redis():
+    """Return the process-wide Redis client, so core and the tools share one connection pool"""
+    return _R
+
+# Set of all task ids, so listing tasks never has to walk the keyspace
+TASK_INDEX_KEY = 'tasks:index'
+# Set once the index has been backfilled with tasks created before it existed
+TASK_INDEX_BUILT_KEY = 'tasks:index:built'
+
+# Marks a task stopped and announces it in one round-trip; no-op if the task_data is gone,
+# or if ARGV[2] is given and no longer matches JSON.GET $.pid (the task was relaunched meanwhile)
+_CLEAR_TASK_SCRIPT = _R.register_script("""
+redis.call('DEL', KEYS[3])
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+if ARGV[2] and redis.call('JSON.GET', KEYS[1], '$.pid') ~= ARGV[2] then
+    return 0
+end
+redis.call('JSON.SET', KEYS[1], '$.pid', 'null')
+redis.call('JSON.SET', KEYS[1], '$.status', '"stopped"')
+redis.call('PUBLISH', KEYS[2], ARGV[1])
+return 1
+""")
+_PROCESS_ENDED = orjson.dumps({"type": "process_ended"})
+
+# How long a positive liveness probe is trusted before the process is checked again
+STATUS_CACHE_TTL = 2
+
+# Marks a task running and caches the probe, but only if ARGV[2] is still the task's pid;
+# a task released (pid null) or relaunched since the probe is left alone
+_MARK_RUNNING_SCRIPT = _R.register_script("""
+if redis.call('JSON.GET', KEYS[1], '$.pid') ~= '[' .. ARGV[2] .. ']' then
+    return 0
+end
+redis.call('JSON.SET', KEYS[1], '$.status', '"running"')
+if ARGV[1] == '1' then
+    redis.call('SET', KEYS[2], ARGV[2], 'EX', ARGV[3])
+end
+return 1
+""")
+
+# Creates the queue if needed, appends every ARGV message and bumps the length counter atomically
+_ENQUEUE_SCRIPT = _R.register_script("""
+redis.call('JSON.SET', KEYS[1], '$', '[]', 'NX')
+redis.call('JSON.ARRAPPEND', KEYS[1], '$', unpack(ARGV))
+return redis.call('INCRBY', KEYS[2], #ARGV)
+""")
+
+# Model short name -> ARN, filled from bedrock:converse:models on first use
+_MODEL_CACHE = {}
+
 def launch_task_agent(task_id=None, 
                 model='sonnet45', 
                 enable_recursion=True,
@@ -40,14 +95,14 @@ def launch_task_agent(task_id=None,
     Returns:
         (pid, task_id) tuple
     """
-    r = redis.Redis(decode_responses=True)
+    r = _R
 
     pid = None
     
     # Check current status and pid and confirm pid is running
     existing_task = False
     if task_id:
-        existing_task, pid, _ = check_task_activity(task_id)  
+        existing_task, pid, _ = check_task_activity(task_id, use_cache=False)
     else:
         task_id = generate_task_id(parent_task_id, base_name)
     
@@ -86,29 +141,32 @@ def launch_task_agent(task_id=None,
             'max_iterations': max_iterations,
             'process_started_at': time.time()
         }
-        r.json().set(f'task_data:{task_id}', '$', task_data)
         conversation = [{'turn_number':0, 'messages':[], 'started_at': time.time()}]
-        r.json().set(f'task:{task_id}', '$', conversation)
-    
-    num_queued = 0
-    if messages:
-        for msg in messages:
-            text_contents = []
-            if msg['role'] == 'user' and msg['content']:
-                for item in msg['content']:
-                    if 'text' in item:
-                        text_contents.append(item['text'])
-                for text_content in text_contents:
-                    queue_message_for_task(task_id, 'user', text_content, sender_id=None, auto_launch=False)
-                    num_queued += 1
-            print(f"[LAUNCHER] Queued {num_queued} initial messages")
+        pipe = r.pipeline()
+        pipe.json().set(f'task_data:{task_id}', '$', task_data)
+        pipe.json().set(f'task:{task_id}', '$', conversation)
+        pipe.sadd(TASK_INDEX_KEY, task_id)
+        pipe.execute()
+    
+    # Queue the text of every initial user message in one batch
+    initial_items = [
+        ('user', item['text'], None)
+        for msg in messages
+        if msg['role'] == 'user' and msg['content']
+        for item in msg['content']
+        if 'text' in item
+    ]
+    if initial_items:
+        queue_messages_for_task_batch(task_id, initial_items, sender_id=None, auto_launch=False)
+        print(f"[LAUNCHER] Queued {len(initial_items)} initial messages")
 
     # Get total messages in queue
-    queued_messages = r.json().get(f'task_queue:{task_id}')
+    queued_messages = get_queue_length(task_id, r)
     
     if start_process and queued_messages:
         # NOW spawn process after task_data is ready
-        process = subprocess.Popen(command, shell=True, preexec_fn=os.setsid)
+        # argv list and start_new_session (not shell/preexec_fn) let CPython use posix_spawn
+        process = subprocess.Popen([sys.executable, str(core_path), task_id], start_new_session=True, close_fds=True)
         pid = process.pid
     
         # Update task_data with PID
@@ -132,8 +190,11 @@ def resolve_model(model, r):
     if model.startswith('arn:') or model.startswith('us.') or model.startswith('eu.'):
         return model
     
-    models = r.json().get('bedrock:converse:models')
-    return models[model]['arn']
+    if model not in _MODEL_CACHE:
+        # Refresh the whole table on a miss, which also picks up newly added models
+        models = r.json().get('bedrock:converse:models')
+        _MODEL_CACHE.update((name, info['arn']) for name, info in models.items())
+    return _MODEL_CACHE[model]
 
 error_message = "Tool use was stopped by an error or a user interruption."
 
@@ -146,52 +207,60 @@ def cleanup_conversation_history(history):
     """
     cleaned_history = []
     
+    if history and os.environ.get('DEBUG_LAST_MESSAGES'):
+        with open('/tmp/last_messages.jsonl', 'w') as f:
+            f.write(json.dumps({'turn': history[-1]['messages']}) + '\n')
+    
     for turn in history:
         turn_messages = turn['messages']
         
-        with open('/tmp/last_messages.jsonl', 'w') as f:
-            f.write(json.dumps({'turn': turn_messages}) + '\n')
-        
-        # Collect all tool results by tool_use_id
+        # One scan of the content blocks: collect all tool results by tool_use_id,
+        # and record the tool_use_ids of each assistant message
         all_tool_results = {}
+        tool_use_ids = []
         for msg in turn_messages:
+            ids = []
             if msg['role'] == 'user':
                 for item in msg['content']:
                     if 'toolResult' in item:
-                        tool_id = item['toolResult']['toolUseId']
-                        all_tool_results[tool_id] = item
+                        all_tool_results[item['toolResult']['toolUseId']] = item
+            elif msg['role'] == 'assistant':
+                ids = [item['toolUse']['toolUseId'] for item in msg['content'] if 'toolUse' in item]
+            tool_use_ids.append(ids)
         
-        # Build cleaned message list
+        # Build cleaned message list, numbering as we go (on copies, so the caller's history is left untouched)
         new_messages = []
         last_role = 'assistant'
-        messages = copy.copy(turn_messages)
+        prev_tool_ids = []
+        
+        def emit(msg):
+            new_messages.append({**msg, 'message_number': len(new_messages)})
         
-        for n, msg in enumerate(messages):
+        for n, (msg, tool_ids) in enumerate(zip(turn_messages, tool_use_ids)):
             timestamp = msg.get('timestamp')
             
             if msg['role'] == 'assistant' and last_role == 'user':
-                new_messages.append(msg)
+                emit(msg)
                 last_role = 'assistant'
+                prev_tool_ids = tool_ids
                 
             elif msg['role'] == 'assistant' and last_role == 'assistant':
                 # Consecutive assistant - insert user message with results from previous assistant
-                prev_assistant = new_messages[-1]
-                tool_ids_needed = [item['toolUse']['toolUseId'] for item in prev_assistant['content'] if 'toolUse' in item]
-                
-                if tool_ids_needed:
+                if prev_tool_ids:
                     user_content = []
-                    for tool_id in tool_ids_needed:
+                    for tool_id in prev_tool_ids:
                         if tool_id in all_tool_results:
                             user_content.append(all_tool_results[tool_id])
                             all_tool_results[tool_id] = None
                         else:
                             user_content.append({'toolResult': {'toolUseId': tool_id, 'content': [{'text': error_message}]}})
                     
-                    new_messages.append({'role': 'user', 'content': user_content, 'timestamp': timestamp})
+                    emit({'role': 'user', 'content': user_content, 'timestamp': timestamp})
                     last_role = 'user'
                 
-                new_messages.append(msg)
+                emit(msg)
                 last_role = 'assistant'
+                prev_tool_ids = tool_ids
                 
             elif msg['role'] == 'user':
                 # Keep only unused tool results and all non-tool content
@@ -206,17 +275,12 @@ def cleanup_conversation_history(history):
                         unused_content.append(item)
                 
                 if unused_content:
-                    msg['content'] = unused_content
-                    new_messages.append(msg)
+                    emit({**msg, 'content': unused_content})
                     last_role = 'user'
                     
             else:
                 print(n, f'[CORE] WARNING: catch-all for message of role {msg["role"]}, last role {last_role}')
-                new_messages.append(msg)
-        
-        # Renumber messages
-        for n, msg in enumerate(new_messages):
-            msg['message_number'] = n
+                emit(msg)
         
         cleaned_history.append({
             'turn_number': turn['turn_number'],
@@ -227,15 +291,15 @@ def cleanup_conversation_history(history):
     return cleaned_history
 
 def proactive_delay(model_arn, task_id):
-    r = redis.Redis(decode_responses=True)
+    r = _R
     task_data = r.json().get(f'task_data:{task_id}')
-    is_alive, pid, _ = check_task_activity(task_id)
+    is_alive, pid, _ = check_task_activity(task_id, use_cache=False)
     if not is_alive:
         return False
     # Check for mandatory backoff
     throttle_state = r.get(f'throttle_state:{model_arn}')
     if throttle_state:
-        state_data = json.loads(throttle_state)
+        state_data = orjson.loads(throttle_state)
         if state_data.get('mandatory_backoff'):
             backoff_time = random.uniform(20, 30)
             print(f"[CORE] Mandatory backoff for {model_arn}: {backoff_time:.1f}s")
@@ -243,7 +307,7 @@ def proactive_delay(model_arn, task_id):
             r.delete(f'throttle_state:{model_arn}')
 
             # Check status again after backoff
-            is_alive, pid, _ = check_task_activity(task_id)
+            is_alive, pid, _ = check_task_activity(task_id, use_cache=False)
             if not is_alive:
                 return False
     
@@ -276,26 +340,19 @@ def build_completion_message(child_task_id, child_conversation, success):
     total_tool_iterations = 0
     final_message = None
     
-    # Find the last assistant message
-    for turn in reversed(child_conversation):
-        for message in reversed(turn.get('messages', [])):
-            if message['role'] == 'assistant':
-                final_message = message['content']
-                break
-        if final_message:
-            break
-    
-    # Count tool iterations
+    # One forward pass: track the last non-empty assistant message and count
+    # assistant messages answered by tool results
     for turn in child_conversation:
-        for i, message in enumerate(turn.get('messages', [])):
+        prev_role = None
+        for message in turn.get('messages', []):
             if message['role'] == 'assistant':
-                next_idx = i + 1
-                if next_idx < len(turn['messages']):
-                    next_msg = turn['messages'][next_idx]
-                    if (next_msg['role'] == 'user' and 
-                        isinstance(next_msg.get('content'), list) and
-                        any('toolResult' in str(content) for content in next_msg['content'])):
-                        total_tool_iterations += 1
+                if message['content']:
+                    final_message = message['content']
+            elif (message['role'] == 'user' and prev_role == 'assistant' and
+                  isinstance(message.get('content'), list) and
+                  any(isinstance(content, dict) and 'toolResult' in content for content in message['content'])):
+                total_tool_iterations += 1
+            prev_role = message['role']
     
     # Extract text from final message
     final_text = ""
@@ -368,7 +425,7 @@ def call_llm_api(bedrock, input_params, task_id, r, last_req_time, throttle_mult
         print(f"[CORE] LLM API response time: {response_time:.1f}s")
         new_last_req_time = time.time()
         new_throttle_multiplier = max(1.0, throttle_multiplier * 0.9)
-        r.publish(f'throttle_success:{model_arn}', json.dumps({'task_id': task_id, 'timestamp': time.time()}))
+        r.publish(f'throttle_success:{model_arn}', orjson.dumps({'task_id': task_id, 'timestamp': time.time()}))
 
     except (ReadTimeoutError, BotocoreClientError) as e:
         # Determine error code for logging and filtering
@@ -389,7 +446,7 @@ def call_llm_api(bedrock, input_params, task_id, r, last_req_time, throttle_mult
         
         # Handle as throttling event
         print(f"[CORE] WARNING: {error_code}, treating as throttling event")
-        r.publish(f'throttle_exception:{model_arn}', json.dumps({
+        r.publish(f'throttle_exception:{model_arn}', orjson.dumps({
             'task_id': task_id,
             'error_code': error_code,
             'timestamp': time.time()
@@ -404,9 +461,18 @@ def call_llm_api(bedrock, input_params, task_id, r, last_req_time, throttle_mult
 
     return response, new_last_req_time, new_throttle_multiplier
 
-def check_task_activity(task_id):
+def check_task_activity(task_id, use_cache=True):
     # Check if task is active by checking process status, and clean up Redis status if not
-    r = redis.Redis(decode_responses=True)
+    # Callers that exit, launch or relaunch on the answer pass use_cache=False, which neither reads nor writes the cache;
+    # only read-only status reports such as query_task use the cached answer
+    r = _R
+
+    # A recent positive probe stands in for the process check
+    if use_cache:
+        cached_pid = r.get(f'status_cache:{task_id}')
+        if cached_pid is not None:
+            return (True, int(cached_pid), None)
+
     result = (False, None, None)
     needs_cleanup = True
     task_data = r.json().get(f'task_data:{task_id}')
@@ -418,95 +484,212 @@ def check_task_activity(task_id):
         if pid is not None:
             try:
                 proc = psutil.Process(pid)
-                cpu = proc.cpu_percent(interval=0)
-                true_status = proc.status()
-                cmdline_str = ' '.join(proc.cmdline())
-                if true_status in good_statuses and 'core.py' in cmdline_str and task_id in cmdline_str:
-                    result = (True, pid, cpu)
-                    r.json().set(f'task_data:{task_id}', '$.status', 'running')
+                if _is_task_process(proc.status(), proc.cmdline(), task_id):
                     needs_cleanup = False
+                    marked = _MARK_RUNNING_SCRIPT(
+                        keys=[f'task_data:{task_id}', f'status_cache:{task_id}'],
+                        args=[int(use_cache), pid, STATUS_CACHE_TTL],
+                        client=r
+                    )
+                    # Otherwise the task was released or relaunched while we probed
+                    if marked:
+                        result = (True, pid, None)
             except:
                 pass
         
-    if needs_cleanup and r.exists(f'task_data:{task_id}'):
-        r.json().set(f'task_data:{task_id}', '$.pid', None)
-        r.json().set(f'task_data:{task_id}', '$.status', 'stopped')
-        r.publish(f'task_messages:{task_id}', json.dumps({"type": "process_ended"}))
+    if needs_cleanup:
+        clear_task_status(task_id, r)
 
     # TO DO: Add logic to clean up dead processes
 
-    # RETURNS (is_alive, pid, cpu_percent)
+    # RETURNS (is_alive, pid, cpu_percent); cpu_percent is always None, as a single unprimed sample is meaningless
     return result
 
+def get_task_ids(r):
+    """Return all task ids from the index, backfilling it with a one-off SCAN if it was never built"""
+    pipe = r.pipeline(transaction=False)
+    pipe.exists(TASK_INDEX_BUILT_KEY)
+    pipe.smembers(TASK_INDEX_KEY)
+    built, task_ids = pipe.execute()
+    if built:
+        return list(task_ids)
+    
+    task_ids = [key.split(':', 1)[1] for key in r.scan_iter(match='task_data:*', count=500)]
+    pipe = r.pipeline()
+    if task_ids:
+        pipe.sadd(TASK_INDEX_KEY, *task_ids)
+    pipe.set(TASK_INDEX_BUILT_KEY, 1)
+    pipe.execute()
+    return task_ids
+
+def _is_task_process(status, cmdline, task_id):
+    """Whether a process with this status and cmdline is the live agent for task_id"""
+    cmdline_str = ' '.join(cmdline or [])
+    return status in good_statuses and 'core.py' in cmdline_str and task_id in cmdline_str
+
+def clear_task_status(task_id, r, expected_pid=None):
+    """Mark a task stopped with no pid and publish process_ended (r may be a pipeline)
+    
+    expected_pid, if given, is the raw JSON.GET $.pid reply the caller based its decision on;
+    the task is left alone if its pid has changed since.
+    """
+    args = [_PROCESS_ENDED] if expected_pid is None else [_PROCESS_ENDED, expected_pid]
+    return _CLEAR_TASK_SCRIPT(
+        keys=[f'task_data:{task_id}', f'task_messages:{task_id}', f'status_cache:{task_id}'],
+        args=args,
+        client=r
+    )
+
 def cleanup_task_statuses(r):
-    # Mop up all incorrectly marked stopped tasks at launch
-    task_keys = r.keys("task:*")
+    # Mop up all incorrectly marked tasks at launch, probing processes in a single sweep
+    task_ids = get_task_ids(r)
+
+    pipe = r.pipeline(transaction=False)
+    for task_id in task_ids:
+        pipe.json().get(f'task_data:{task_id}', '$.pid')
+    pids = pipe.execute()
+
+    # Snapshot processes only after reading pids, so a task launched in between is still found alive
+    processes = {p.info['pid']: p.info for p in psutil.process_iter(['pid', 'status', 'cmdline'])}
+
+    pipe = r.pipeline(transaction=False)
+    for task_id, pid in zip(task_ids, pids):
+        if pid is None:
+            # task_data is gone, so drop the task from the index
+            pipe.srem(TASK_INDEX_KEY, task_id)
+            continue
+        info = processes.get(pid[0]) if pid else None
+        if info and _is_task_process(info['status'], info['cmdline'], task_id):
+            _MARK_RUNNING_SCRIPT(
+                keys=[f'task_data:{task_id}', f'status_cache:{task_id}'],
+                args=[0, pid[0], STATUS_CACHE_TTL],
+                client=pipe
+            )
+        else:
+            # Only if the pid is still the one judged dead; a relaunch since the read is left alone
+            clear_task_status(task_id, pipe, expected_pid=orjson.dumps(pid).decode())
+    pipe.execute()
 
-    for tk in task_keys:
-        task_id = tk.lstrip("task").lstrip(':')
-        check_task_activity(task_id)
+    print(f"[CORE] Cleaned up {len(task_ids)} task statuses")
 
-    print(f"[CORE] Cleaned up {len(task_keys)} task statuses")
+def _tool_use_summary(msg):
+    """Describe the first tool use in an assistant message, or None if it has none"""
+    for content_block in msg.get('content', []):
+        if 'toolUse' in content_block:
+            tool_use = content_block['toolUse']
+            return {
+                'tool_name': tool_use['name'],
+                'tool_input': tool_use['input'],
+                'started_at': msg.get('timestamp'),
+                'elapsed_seconds': time.time() - msg.get('timestamp', time.time())
+            }
+    return None
 
 def get_last_tool_use(task_id, r):
     """Extract most recent tool use from conversation"""
-    conversation = r.json().get(f'task:{task_id}')
-    for turn in reversed(conversation):
+    # Usually in the current turn, so fetch only its assistant messages first
+    recent = r.json().get(f'task:{task_id}', '$[-1].messages[?(@.role=="assistant")]')
+    for msg in reversed(recent or []):
+        summary = _tool_use_summary(msg)
+        if summary:
+            return summary
+    
+    conversation = r.json().get(f'task:{task_id}') or []
+    for turn in reversed(conversation[:-1]):
         for msg in reversed(turn.get('messages', [])):
             if msg['role'] == 'assistant':
-                for content_block in msg.get('content', []):
-                    if 'toolUse' in content_block:
-                        tool_use = content_block['toolUse']
-                        return {
-                            'tool_name': tool_use['name'],
-                            'tool_input': tool_use['input'],
-                            'started_at': msg.get('timestamp'),
-                            'elapsed_seconds': time.time() - msg.get('timestamp', time.time())
-                        }
+                summary = _tool_use_summary(msg)
+                if summary:
+                    return summary
     return None
 
 def get_child_tree(task_id, r):
-    """Recursively get all children of a task"""
+    """Get all descendants of a task, breadth-first"""
+    # Load every task's parent and explicit children in one scan and one pipelined batch
+    task_ids = get_task_ids(r)
+    pipe = r.pipeline(transaction=False)
+    for tid in task_ids:
+        pipe.json().get(f'task_data:{tid}', '$.parent_task_id', '$.children')
+    
+    children_of = {}
+    for tid, fields in zip(task_ids, pipe.execute()):
+        if not fields:
+            continue
+        children_of.setdefault(tid, []).extend((fields.get('$.children') or [[]])[0] or [])
+        parent = (fields.get('$.parent_task_id') or [None])[0]
+        if parent:
+            children_of.setdefault(parent, []).append(tid)
+    
     children = []
-    task_data = r.json().get(f'task_data:{task_id}')
-    for child_id in task_data.get('children', []):
-        children.append(child_id)
-        children.extend(get_child_tree(child_id, r))
-    all_tasks = r.keys('task_data:*')
-    for key in all_tasks:
-        td = r.json().get(key)
-        if td.get('parent_task_id') == task_id:
-            cid = td['task_id']
-            if cid not in children:
-                children.append(cid)
-                children.extend(get_child_tree(cid, r))
+    seen = {task_id}
+    frontier = [task_id]
+    while frontier:
+        next_frontier = []
+        for tid in frontier:
+            for cid in children_of.get(tid, []):
+                if cid not in seen:
+                    seen.add(cid)
+                    children.append(cid)
+                    next_frontier.append(cid)
+        frontier = next_frontier
     return children
 
+def get_queue_length(task_id, r):
+    """Return the number of messages in a task's queue without fetching them"""
+    queue_length = r.get(f'task_queue_len:{task_id}')
+    if queue_length is not None:
+        return int(queue_length)
+    
+    # No counter yet (queue written before counters existed)
+    try:
+        lengths = r.json().arrlen(f'task_queue:{task_id}', '$')
+    except redis.ResponseError:
+        # Queue key does not exist
+        return 0
+    return lengths[0] if lengths and lengths[0] else 0
+
 def queue_message_for_task(task_id: str, message_type: str, content: str, sender_id=None, tool_use_id=None, auto_launch=True):
     """Add message to task's input queue"""
-    r = redis.Redis(decode_responses=True)
-    
-    queue_msg = {
-        'type': message_type,
-        'content': content,
-        'sender_id': sender_id,
-        'timestamp': time.time()
-    }
-    
-    if tool_use_id:
-        queue_msg['tool_use_id'] = tool_use_id
-    
-    queue_key = f'task_queue:{task_id}'
-    existing = r.json().get(queue_key)
-    if not existing:
-        r.json().set(queue_key, '$', [])
+    queue_messages_for_task_batch(task_id, [(message_type, content, tool_use_id)], sender_id=sender_id, auto_launch=auto_launch)
+
+def queue_messages_for_task_batch(task_id: str, items, sender_id=None, auto_launch=True):
+    """
+    Add several messages to a task's input queue in a single round-trip
     
-    r.json().arrappend(queue_key, '$', queue_msg)
+    Args:
+        task_id: Task to queue messages for
+        items: Iterable of (message_type, content, tool_use_id) tuples
+        sender_id: Sender of all messages in the batch
+        auto_launch: Whether to launch the task if it is not running
+    """
+    r = _R
+    
+    queue_msgs = []
+    for message_type, content, tool_use_id in items:
+        queue_msg = {
+            'type': message_type,
+            'content': content,
+            'sender_id': sender_id,
+            'timestamp': time.time()
+        }
+        if tool_use_id:
+            queue_msg['tool_use_id'] = tool_use_id
+        queue_msgs.append(queue_msg)
+    
+    if not queue_msgs:
+        return
+    
+    _ENQUEUE_SCRIPT(
+        keys=[f'task_queue:{task_id}', f'task_queue_len:{task_id}'],
+        args=[orjson.dumps(queue_msg) for queue_msg in queue_msgs],
+        client=r
+    )
 
-    is_running, _, _ = check_task_activity(task_id)
-    print(f"[CORE] Message queued for task {task_id}. Task is running? {is_running}")
-    if not is_running and auto_launch:
+    if not auto_launch:
+        print(f"[CORE] {len(queue_msgs)} message(s) queued for task {task_id}")
+        return
+    is_running, _, _ = check_task_activity(task_id, use_cache=False)
+    print(f"[CORE] {len(queue_msgs)} message(s) queued for task {task_id}. Task is running? {is_running}")
+    if not is_running:
         print(f"[CORE] Launching task {task_id}")
         launch_task_agent(task_id, start_process=True)
-
-   
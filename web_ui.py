@@ -1,15 +1,15 @@
 #!/usr/bin/env python3
-import json, asyncio, time, socket, sys, subprocess, uuid
+import asyncio, time, socket, sys, subprocess, uuid
+import orjson
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, ORJSONResponse
 from pathlib import Path
 import redis.asyncio as aioredis
-from typing import Dict, Optional
+from typing import Dict, Optional, Set
 import uuid
-import redis
 
 sys.path.insert(0, str(Path(__file__).parent))
-from utils import queue_message_for_task
+from utils import queue_message_for_task, get_task_ids, TASK_INDEX_KEY, TASK_INDEX_BUILT_KEY, get_redis
 from utils import launch_task_agent
 
 redis_client = aioredis.Redis(
@@ -27,7 +27,144 @@ redis_client = aioredis.Redis(
 )
 active_websockets: Dict[str, WebSocket] = {}
 
-app = FastAPI()
+# Window in which bursts of refetch-triggering events collapse into one snapshot
+REFRESH_DEBOUNCE_SECONDS = 0.075
+# A viewer whose socket takes longer than this to accept a frame is dropped
+SEND_TIMEOUT_SECONDS = 10
+
+
+class PubsubHub:
+    """One Redis pubsub connection shared by every websocket, fanning each task's events out to its viewers
+
+    Each websocket has its own outbox queue and sender task, so a slow viewer only delays itself.
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self.pubsub = None
+        self.subs: Dict[str, Set[WebSocket]] = {}
+        self.outboxes: Dict[WebSocket, asyncio.Queue] = {}
+        self.senders: Dict[WebSocket, asyncio.Task] = {}
+        self.reader = None
+        self.lock = asyncio.Lock()
+        self.pending_refresh: Set[str] = set()
+        # Strong references to scheduled refreshes; the event loop only keeps weak ones
+        self._refresh_tasks: Set[asyncio.Task] = set()
+
+    @staticmethod
+    def channels(task_id):
+        return (f"task_messages:{task_id}", f"task_complete:{task_id}", f"task_state:{task_id}")
+
+    async def subscribe(self, task_id, websocket):
+        async with self.lock:
+            if self.pubsub is None:
+                self.pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+            if task_id not in self.subs:
+                self.subs[task_id] = set()
+                await self.pubsub.subscribe(*self.channels(task_id))
+            self.subs[task_id].add(websocket)
+            if websocket not in self.outboxes:
+                outbox = asyncio.Queue()
+                self.outboxes[websocket] = outbox
+                self.senders[websocket] = asyncio.create_task(self._send_loop(websocket, outbox))
+            if self.reader is None or self.reader.done():
+                self.reader = asyncio.create_task(self._read())
+
+    async def unsubscribe(self, task_id, websocket):
+        async with self.lock:
+            self.outboxes.pop(websocket, None)
+            sender = self.senders.pop(websocket, None)
+            if sender is not None:
+                sender.cancel()
+            sockets = self.subs.get(task_id)
+            if sockets is None:
+                return
+            sockets.discard(websocket)
+            if not sockets:
+                del self.subs[task_id]
+                await self.pubsub.unsubscribe(*self.channels(task_id))
+
+    async def _read(self):
+        while True:
+            try:
+                message = await self.pubsub.get_message(timeout=1.0)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[WEB_SERVER] Pubsub read failed: {type(e).__name__}: {e}")
+                await asyncio.sleep(1)
+                continue
+            if message is None or message['type'] != 'message':
+                continue
+            channel_type, task_id = message['channel'].split(':', 1)
+            if task_id not in self.subs:
+                continue
+            try:
+                await self._dispatch(channel_type, task_id, message['data'])
+            except Exception as e:
+                print(f"[WEB_SERVER] Failed to dispatch {channel_type} event for {task_id}: {type(e).__name__}: {e}")
+
+    async def _dispatch(self, channel_type, task_id, data):
+        if channel_type == "task_state":
+            # State change notification
+            state_data = orjson.loads(data)
+            self.broadcast(task_id, {"type": "state", "status": state_data['status']})
+        elif channel_type == "task_messages" and orjson.loads(data).get("type") == "append":
+            # Delta carrying the new messages; forwarded as published
+            self.broadcast_text(task_id, data)
+        elif task_id not in self.pending_refresh:
+            # Other message notifications; one snapshot per debounce window for every viewer of the task
+            self.pending_refresh.add(task_id)
+            refresh = asyncio.create_task(self._refresh_later(task_id))
+            self._refresh_tasks.add(refresh)
+            refresh.add_done_callback(self._refresh_tasks.discard)
+
+    async def _refresh_later(self, task_id):
+        try:
+            await asyncio.sleep(REFRESH_DEBOUNCE_SECONDS)
+        finally:
+            self.pending_refresh.discard(task_id)
+        try:
+            conversation = await self.client.json().get(f"task:{task_id}")
+            self.broadcast(task_id, {"type": "update", "data": conversation})
+        except Exception as e:
+            print(f"[WEB_SERVER] Failed to refresh {task_id}: {type(e).__name__}: {e}")
+
+    def broadcast(self, task_id, payload):
+        # Text frames, since the client parses event.data as a string
+        self.broadcast_text(task_id, orjson.dumps(payload).decode())
+
+    def broadcast_text(self, task_id, text):
+        for websocket in self.subs.get(task_id, ()):
+            self.send_text(websocket, text)
+
+    def send_text(self, websocket, text):
+        """Queue a frame for one websocket, behind anything already queued for it"""
+        outbox = self.outboxes.get(websocket)
+        if outbox is not None:
+            outbox.put_nowait(text)
+
+    async def _send_loop(self, websocket, outbox):
+        while True:
+            text = await outbox.get()
+            try:
+                await asyncio.wait_for(websocket.send_text(text), SEND_TIMEOUT_SECONDS)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Stop queueing for this viewer; closing it ends its endpoint, which unsubscribes
+                print(f"[WEB_SERVER] Dropping websocket after failed send: {type(e).__name__}: {e}")
+                self.outboxes.pop(websocket, None)
+                try:
+                    await websocket.close()
+                except Exception:
+                    pass
+                return
+
+
+hub = PubsubHub(redis_client)
+
+app = FastAPI(default_response_class=ORJSONResponse)
 
 @app.get("/", response_class=HTMLResponse)
 async def root():
@@ -48,15 +185,27 @@ async def health():
 @app.get("/api/tasks")
 async def list_tasks():
     """Get all tasks with their hierarchy"""
-    task_keys = await redis_client.keys("task_data:*")
+    async with redis_client.pipeline(transaction=False) as pipe:
+        pipe.exists(TASK_INDEX_BUILT_KEY)
+        pipe.smembers(TASK_INDEX_KEY)
+        built, task_ids = await pipe.execute()
+    if not built:
+        # One-off backfill of the index from a keyspace scan
+        loop = asyncio.get_event_loop()
+        task_ids = await loop.run_in_executor(None, lambda: get_task_ids(get_redis()))
+    
+    # Fetch every task_data and conversation in one round-trip
+    async with redis_client.pipeline(transaction=False) as pipe:
+        for task_id in task_ids:
+            pipe.json().get(f"task_data:{task_id}", '$')
+            pipe.json().get(f"task:{task_id}", '$')
+        results = await pipe.execute()
+    
     tasks = []
-    for key in task_keys:
-        task_id = key.split(":", 1)[1]
-        task_data = await redis_client.json().get(key, '$')
+    for task_data, conversation in zip(results[::2], results[1::2]):
         if task_data and isinstance(task_data, list):
             task_data = task_data[0]
         if task_data and isinstance(task_data, dict):
-            conversation = await redis_client.json().get(f"task:{task_id}", '$')
             if isinstance(conversation, list):
                 conversation = conversation[0] if conversation else None
             if conversation:
@@ -122,7 +271,12 @@ async def post_message(task_id: str, data: dict):
     
     sample = message[:100]
     print(f"[WEB_SERVER] Queueing message for task {task_id}: {sample}")
-    queue_message_for_task(task_id, 'user', message, sender_id=None)
+    # Queueing may probe the process and launch the agent; keep it off the event loop
+    loop = asyncio.get_event_loop()
+    await loop.run_in_executor(
+        None,
+        lambda: queue_message_for_task(task_id, 'user', message, sender_id=None)
+    )
     pid = None
     
     return {"success": True, "pid": pid}
@@ -132,7 +286,7 @@ async def stop_task(task_id: str):
     """Stop a running task"""
     
     print(f"[WEB_SERVER] Stopping task {task_id}")
-    await redis_client.publish("kill_requests", json.dumps({"task_id": task_id}))
+    await redis_client.publish("kill_requests", orjson.dumps({"task_id": task_id}))
     
     return {"success": True}
 
@@ -141,83 +295,42 @@ async def websocket_endpoint(websocket: WebSocket, task_id: str):
     """WebSocket for real-time task updates"""
     await websocket.accept()
     
-    # Create fresh Redis connection for this websocket
-    ws_redis = aioredis.Redis(
-        host='localhost', 
-        port=6379, 
-        db=0, 
-        decode_responses=True,
-        socket_keepalive=True,
-        health_check_interval=30
-    )
-    
-    # Check if task exists
-    task_data = await ws_redis.json().get(f"task_data:{task_id}")
-    
     active_websockets[task_id] = websocket
     
-    # Subscribe to task messages and state changes
-    pubsub = ws_redis.pubsub()
-    await pubsub.subscribe(f"task_messages:{task_id}", f"task_complete:{task_id}", f"task_state:{task_id}")
+    # Subscribe to task messages and state changes through the shared hub
+    await hub.subscribe(task_id, websocket)
     
     try:
         # Send initial conversation state
-        conversation = await ws_redis.json().get(f"task:{task_id}")
+        conversation = await redis_client.json().get(f"task:{task_id}")
         if conversation:
-            await websocket.send_json({"type": "conversation", "data": conversation})
+            hub.send_text(websocket, orjson.dumps({"type": "conversation", "data": conversation}).decode())
         
-        # Listen for updates
-        async def listen_redis():
-            try:
-                async for message in pubsub.listen():
-                    if message['type'] == 'message':
-                        channel = message['channel']
-                        if channel == f"task_state:{task_id}":
-                            # State change notification
-                            state_data = json.loads(message['data'])
-                            await websocket.send_json({"type": "state", "status": state_data['status']})
-                        else:
-                            # Message update notification
-                            conversation = await ws_redis.json().get(f"task:{task_id}")
-                            await websocket.send_json({"type": "update", "data": conversation})
-            except asyncio.CancelledError:
-                pass
-        
-        async def listen_websocket():
-            try:
-                while True:
-                    data = await websocket.receive_json()
-                    if data.get('type') == 'stop':
-                        await stop_task(task_id)
-            except asyncio.CancelledError:
-                pass
-        
-        # Run both listeners concurrently
-        tasks = [asyncio.create_task(listen_redis()), asyncio.create_task(listen_websocket())]
-        await asyncio.gather(*tasks, return_exceptions=True)
+        # Updates are pushed by the hub; this loop only handles client commands
+        while True:
+            data = await websocket.receive_json()
+            if data.get('type') == 'stop':
+                await stop_task(task_id)
     except WebSocketDisconnect:
         pass
     finally:
-        for task in tasks:
-            task.cancel()
-        await asyncio.gather(*tasks, return_exceptions=True)
-        await pubsub.unsubscribe(f"task_messages:{task_id}", f"task_complete:{task_id}", f"task_state:{task_id}")
-        await pubsub.aclose()
-        await ws_redis.aclose()
-        if task_id in active_websockets:
+        await hub.unsubscribe(task_id, websocket)
+        if active_websockets.get(task_id) is websocket:
             del active_websockets[task_id]
 
 def find_available_port(start_port=8000):
-    """Find next available port starting from start_port"""
-    port = start_port
-    while port < start_port + 100:
+    """Return start_port if it is free, otherwise a free port chosen by the kernel"""
+    for port in (start_port, 0):
+        if port is None:
+            continue
         sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         try:
             sock.bind(('', port))
-            sock.close()
-            return port
+            return sock.getsockname()[1]
         except OSError:
-            port += 1
+            continue
+        finally:
+            sock.close()
     raise RuntimeError("No available ports found")
 
 if __name__ == "__main__":